@@ -20,21 +20,37 @@
 #
 """A command-line tool that can decide whether to use `git mv` or `mv`."""
 
-import argparse
 import logging
 import os
 import shutil
+import signal
+import stat
 import subprocess
 import sys
 from pathlib import Path
+from types import SimpleNamespace
 
+from git_smartmv.file import GitError
 
-class CliError(Exception):
-    """Error with the command-line interface."""
+# The absolute paths of the commands are resolved only once, which also spares
+# subprocess from searching PATH each time a command is executed.
+EXECUTABLES = {cmd: shutil.which(cmd) for cmd in ("mv", "git")}
 
+# The file descriptors created by Python are non-inheritable (PEP 446), which
+# makes closing all the other file descriptors in the child unnecessary. The
+# signal handlers do not need to be restored either for the Git queries whose
+# output is always read until the end.
+GIT_QUERY_KWARGS = {"close_fds": False, "restore_signals": False}
 
-class GitError(Exception):
-    """Error with Git."""
+# The environment variables that change how Git finds the repository of a
+# directory
+GIT_DISCOVERY_ENV_VARS = ("GIT_DIR", "GIT_WORK_TREE",
+                          "GIT_CEILING_DIRECTORIES",
+                          "GIT_DISCOVERY_ACROSS_FILESYSTEM")
+
+
+class CliError(Exception):
+    """Error with the command-line interface."""
 
 
 class Smartmv:
@@ -47,8 +63,8 @@ class Smartmv:
                             format="[%(name)s] %(message)s")
         self._logger = logging.getLogger(self.exe_name)
 
-        for cmd in ("mv", "git"):
-            if not shutil.which(cmd):
+        for cmd, executable in EXECUTABLES.items():
+            if not executable:
                 err_str = f"{self.exe_name}: '{cmd}': command not found"
                 raise CliError(err_str)
 
@@ -58,20 +74,32 @@ class Smartmv:
         self._args = None
         self._cwd_git_toplevel = None
         self._source_paths = []
+        self._source_paths_by_parent = {}
+        self._source_is_dir = {}
         self._dest_path = ""
         self._classified_source_paths = {"mv": [], "git mv": []}
         self._dest_git_repo = None
         self._mv_commands = {}
+        self._toplevel_cache = {}
+        self._tracked_cache = {}
+        self._cwd = os.getcwd()
+        self._replace_process = False
+
+    def main(self, argv=None, replace_process=False):
+        """Move the files.
 
-    def main(self):
+        When 'replace_process' is True and a single command needs to be
+        executed, the Python process is replaced by that command.
+        """
         self._reset()
+        self._replace_process = replace_process
 
         try:
             self._cwd_git_toplevel = self.get_git_toplevel(".")
         except GitError:
             self._cwd_git_toplevel = None
 
-        self._parse_args()
+        self._parse_args(argv)
 
         self._step1_parse_paths()
         self._step2_classify_paths()
@@ -79,7 +107,24 @@ class Smartmv:
         self._step4_warn_if_file_count_exceeds_threshold()
         self._step5_execute_mv_commands()
 
-    def _parse_args(self):
+    def _parse_args(self, argv=None):
+        if argv is None:
+            argv = sys.argv[1:]
+
+        # Without options, which is the most common case, the arguments are
+        # only files. The construction of the argument parser, and the import
+        # of argparse, can be skipped.
+        if len(argv) >= 2 and not any(arg.startswith("-") for arg in argv):
+            self._args = SimpleNamespace(files=list(argv),
+                                         verbose=False,
+                                         force=False,
+                                         non_interactive=False,
+                                         warning_threshold=-1)
+            return
+
+        # pylint: disable=import-outside-toplevel
+        import argparse
+
         desc = str(__doc__).splitlines()[0]
         usage = "%(prog)s [--option] <SOURCE>... <DEST>"
         parser = argparse.ArgumentParser(description=desc,
@@ -115,7 +160,7 @@ class Smartmv:
             parser.add_argument(opt, long_opt, action="store_true",
                                 default=False, help=help_str)
 
-        self._args = parser.parse_args()
+        self._args = parser.parse_args(argv)
         if len(self._args.files) < 2:
             print(f"{self.exe_name}: missing destination file operand after "
                   f"'{self._args.files[0]}'", file=sys.stderr)
@@ -127,13 +172,19 @@ class Smartmv:
         self._logger.debug("source_paths: %s", str(self._source_paths))
         self._logger.debug("dest_path: %s", str(self._dest_path))
 
-        if len(self._source_paths) > 1 and not self._dest_path.is_dir():
+        try:
+            dest_mode = os.stat(self._dest_path).st_mode
+        except OSError:
+            dest_mode = None
+
+        if len(self._source_paths) > 1 and \
+                (dest_mode is None or not stat.S_ISDIR(dest_mode)):
             print(f"{self.exe_name}: target '{self._dest_path}' is not a "
                   "directory", file=sys.stderr)
             sys.exit(1)
 
         try:
-            if self._dest_path.exists():
+            if dest_mode is not None:
                 # The file/directory will be MOVED. Retrieve the the Git
                 # top-level directory of the destination directory, and store
                 # it in a variable.
@@ -143,46 +194,103 @@ class Smartmv:
                 # top-level directory of the parent directory, and store
                 # it in a variable.
                 self._dest_git_repo = self.get_git_toplevel(
-                    self._dest_path.absolute().parent
+                    self._absolute(self._dest_path).parent
                 )
         except GitError:
             self._dest_git_repo = None
 
         self._logger.debug("dest_git_repo: %s", str(self._dest_git_repo))
 
+        self._scan_sources()
+
+    def _scan_sources(self):
+        """Gather the metadata of the source paths in a single pass."""
         for origin_path in self._source_paths:
-            if not (origin_path.is_symlink() or origin_path.exists()):
+            # A single lstat() also succeeds for dangling symbolic links
+            try:
+                mode = os.lstat(origin_path).st_mode
+            except OSError as err:
                 print(f"{self.exe_name}: cannot stat '{origin_path}': "
-                      "No such file or directory", file=sys.stderr)
+                      f"{err.strerror}", file=sys.stderr)
                 sys.exit(1)
 
-    def _step2_classify_paths(self):
-        for origin_path in self._source_paths:
-            origin_git_repo = None
-            origin_path_tracked = None
-            try:
-                origin_git_repo = self.get_git_toplevel(origin_path)
-            except GitError:
-                pass
+            if stat.S_ISLNK(mode):
+                self._source_is_dir[origin_path] = origin_path.is_dir()
             else:
+                self._source_is_dir[origin_path] = stat.S_ISDIR(mode)
+
+            # The source paths are usually located in a few directories
+            parent_dir = os.path.realpath(
+                os.path.dirname(self._abspath(origin_path))
+            )
+            self._source_paths_by_parent.setdefault(parent_dir, []) \
+                .append(origin_path)
+
+    def _step2_classify_paths(self):
+        # When Git needs to be executed, the parent directories that have not
+        # been resolved yet are resolved in parallel.
+        parent_dirs = [parent_dir
+                       for parent_dir in self._source_paths_by_parent
+                       if Path(parent_dir) not in self._toplevel_cache]
+        if len(parent_dirs) > 1 and self._git_discovery_overridden():
+            # Imported here because the common case (a few paths located in
+            # the same directory) does not need it.
+            # pylint: disable=import-outside-toplevel
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(8, len(parent_dirs))) \
+                    as executor:
+                for parent_dir, git_repo in zip(
+                        parent_dirs,
+                        executor.map(self._git_rev_parse_toplevel,
+                                     parent_dirs)):
+                    self._toplevel_cache[Path(parent_dir)] = git_repo
+
+        # The Git repository of a path is the repository of the directory that
+        # contains it. Group the source paths by Git repository in order to
+        # retrieve the tracked paths of each repository with a single Git
+        # command.
+        origin_git_repos = {}
+        paths_by_git_repo = {}
+        for parent_dir, origin_paths in self._source_paths_by_parent.items():
+            # The parent directories are known to exist
+            origin_git_repo = self._get_dir_git_toplevel(Path(parent_dir))
+            if origin_git_repo:
                 self._logger.debug("")
                 self._logger.debug("origin_git_repo: %s -> %s",
-                                   str(origin_path), str(origin_git_repo))
+                                   str(origin_paths), str(origin_git_repo))
+                paths_by_git_repo.setdefault(origin_git_repo, []) \
+                    .extend(origin_paths)
+
+            for origin_path in origin_paths:
+                origin_git_repos[origin_path] = origin_git_repo
 
-                origin_path_tracked = self.is_tracked_by_git(origin_path)
+        tracked_paths = set()
+        for git_repo, paths in paths_by_git_repo.items():
+            tracked_paths |= self.get_tracked_paths(git_repo, paths)
+
+        for origin_path in self._source_paths:
+            origin_git_repo = origin_git_repos[origin_path]
+            origin_path_tracked = origin_path in tracked_paths
+            if origin_git_repo:
                 self._logger.debug("origin_is_tracked: %s -> %s",
                                    str(origin_path), str(origin_path_tracked))
 
+            # The paths are stored as the strings that will be passed to the
+            # commands.
             if origin_path_tracked and origin_git_repo == self._dest_git_repo:
                 if self._cwd_git_toplevel and \
                         self._cwd_git_toplevel == origin_git_repo:
-                    self._classified_source_paths["git mv"].append(origin_path)
+                    self._classified_source_paths["git mv"].append(
+                        os.fspath(origin_path)
+                    )
                 else:
                     self._classified_source_paths["git mv"].append(
-                        origin_path.absolute()
+                        os.fspath(self._absolute(origin_path))
                     )
             else:
-                self._classified_source_paths["mv"].append(origin_path)
+                self._classified_source_paths["mv"].append(
+                    os.fspath(origin_path)
+                )
 
     def _step3_gen_mv_commands(self):
         specify_repo = True
@@ -190,6 +298,13 @@ class Smartmv:
                 self._cwd_git_toplevel == self._dest_git_repo:
             specify_repo = False
 
+        dest_path = os.fspath(self._dest_path)
+        if self._cwd_git_toplevel and \
+                self._cwd_git_toplevel == self._dest_git_repo:
+            git_dest_path = dest_path
+        else:
+            git_dest_path = os.fspath(self._absolute(self._dest_path))
+
         commands = {
             "git mv": ["git"] +
             (["-C", str(self._dest_git_repo)] if specify_repo else []) +
@@ -199,6 +314,8 @@ class Smartmv:
             "mv": ["mv"],
         }
 
+        # A single command is generated per command type, whatever the number
+        # of source paths.
         for cmd_type in ("git mv", "mv"):
             if not self._classified_source_paths[cmd_type]:
                 continue
@@ -217,18 +334,12 @@ class Smartmv:
                 self._mv_commands[cmd_type] += ["-f"]
 
             self._mv_commands[cmd_type] += \
-                [str(item) for item in self._classified_source_paths[cmd_type]]
+                self._classified_source_paths[cmd_type]
 
             if cmd_type == "git mv":
-                if self._cwd_git_toplevel and \
-                        self._cwd_git_toplevel == self._dest_git_repo:
-                    self._mv_commands[cmd_type].append(str(self._dest_path))
-                else:
-                    self._mv_commands[cmd_type].append(
-                        str(self._dest_path.absolute())
-                    )
+                self._mv_commands[cmd_type].append(git_dest_path)
             elif cmd_type == "mv":
-                self._mv_commands[cmd_type].append(str(self._dest_path))
+                self._mv_commands[cmd_type].append(dest_path)
 
     def _step4_warn_if_file_count_exceeds_threshold(self):
         """Display a warning before moving a large number of files/folders."""
@@ -237,22 +348,20 @@ class Smartmv:
 
         # Display
         num_files = 0
-        not_displayed_files = set()
+        files = {}  # Ordered set
         for source_path in self._source_paths:
-            if source_path.is_dir():
-                for sub_path in source_path.glob("**/*"):
-                    if not sub_path.is_dir():
-                        not_displayed_files.add(str(sub_path))
-                        num_files += 1
+            if self._source_is_dir[source_path]:
+                for sub_path in self.walk_files(source_path):
+                    files[sub_path] = None
+                    num_files += 1
             else:
-                not_displayed_files.add(str(source_path))
+                files[str(source_path)] = None
                 num_files += 1
 
-            if num_files >= self._args.warning_threshold:
-                for cur_path in not_displayed_files:
-                    print(cur_path)
-                not_displayed_files = set()
-                continue
+        if num_files >= self._args.warning_threshold and files:
+            # A single write instead of one per file
+            sys.stdout.write("\n".join(files) + "\n")
+            sys.stdout.flush()
 
         # Confirm
         if num_files >= self._args.warning_threshold:
@@ -270,11 +379,27 @@ class Smartmv:
             if not self.confirm("Execute? [y,n] "):
                 sys.exit(1)
 
+        if self._replace_process and len(self._mv_commands) == 1:
+            # Nothing needs to be done after the command. Replacing the
+            # process avoids a fork() and waiting for the command.
+            cmd = next(iter(self._mv_commands.values()))
+            print("[RUN]", subprocess.list2cmdline(cmd))
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Python ignores SIGPIPE and SIGXFSZ, and ignored signals remain
+            # ignored after exec(). This restores them like
+            # 'restore_signals=True' does.
+            for signame in ("SIGPIPE", "SIGXFSZ"):
+                if hasattr(signal, signame):
+                    signal.signal(getattr(signal, signame), signal.SIG_DFL)
+            os.execv(EXECUTABLES[cmd[0]], cmd)
+
         errno = 0
         for _, cmd in self._mv_commands.items():
             print("[RUN]", subprocess.list2cmdline(cmd))
             try:
-                subprocess.check_call(cmd)
+                subprocess.check_call(cmd, executable=EXECUTABLES[cmd[0]],
+                                      close_fds=False)
             except subprocess.CalledProcessError as err:
                 print(f"Error: {err}.", file=sys.stderr)
                 errno = 1
@@ -282,29 +407,105 @@ class Smartmv:
         if errno:
             sys.exit(errno)
 
+    def _absolute(self, path: os.PathLike) -> Path:
+        """Equivalent to Path(path).absolute() without calling os.getcwd()."""
+        return Path(self._cwd, path)
+
+    def _abspath(self, path: os.PathLike) -> str:
+        """Equivalent to os.path.abspath() without calling os.getcwd()."""
+        return os.path.normpath(os.path.join(self._cwd, path))
+
+    @staticmethod
+    def walk_files(directory: os.PathLike):
+        """Yield the paths of the files located under 'directory'.
+
+        Symbolic links to directories are neither followed nor reported.
+        """
+        directory = os.fspath(directory)
+        stack = ["" if directory == "." else directory]
+        while stack:
+            cur_dir = stack.pop()
+            try:
+                with os.scandir(cur_dir or ".") as entries:
+                    for entry in entries:
+                        entry_path = os.path.join(cur_dir, entry.name)
+                        # The file type is usually provided by the directory
+                        # entry itself, without the need to call stat().
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry_path)
+                        elif not entry.is_dir():
+                            yield entry_path
+            except OSError:
+                continue
+
     def is_tracked_by_git(self, path: os.PathLike):
         """Return True if 'path' is being tracked by Git."""
         path = Path(path)
 
         try:
-            cmd = ["git", "-C", str(self.get_git_toplevel(path)),
-                   "ls-files", "--error-unmatch", str(path.absolute())]
+            git_repo = self.get_git_toplevel(path)
         except GitError:
             return False
 
-        cwd = path
-        if path.is_file():
-            cwd = path.parent.absolute()
+        return path in self.get_tracked_paths(git_repo, [path])
 
+    def get_tracked_paths(self, git_repo: os.PathLike, paths) -> set:
+        """Return the subset of 'paths' that is being tracked by 'git_repo'.
+
+        A single 'git ls-files' command is executed for all the paths that
+        have not already been queried.
+        """
+        git_repo = Path(git_repo)
+
+        result = set()
+        relative_paths = {}
+        for path in paths:
+            path = Path(path)
+            abs_path = self._abspath(path)
+            real_path = Path(os.path.realpath(os.path.dirname(abs_path)),
+                             os.path.basename(abs_path))
+            try:
+                relative_path = real_path.relative_to(git_repo).as_posix()
+            except ValueError:
+                continue
+
+            try:
+                if self._tracked_cache[(git_repo, relative_path)]:
+                    result.add(path)
+            except KeyError:
+                relative_paths[path] = relative_path
+
+        if not relative_paths:
+            return result
+
+        # The paths are not pathspecs: their names may contain magic (':') or
+        # glob characters.
+        cmd = ["git", "--literal-pathspecs", "-C", str(git_repo), "ls-files",
+               "-z", "--full-name", "--"] + list(relative_paths.values())
         try:
-            subprocess.check_call(cmd,
-                                  stdout=subprocess.DEVNULL,
-                                  stderr=subprocess.DEVNULL,
-                                  cwd=cwd)
+            output = subprocess.check_output(cmd,
+                                             executable=EXECUTABLES["git"],
+                                             stderr=subprocess.DEVNULL,
+                                             **GIT_QUERY_KWARGS)
         except subprocess.CalledProcessError:
-            return False
+            return result
 
-        return True
+        # The tracked files and all their parent directories
+        tracked = set()
+        for item in output.split(b"\0"):
+            item = os.fsdecode(item)
+            while item and item not in tracked:
+                tracked.add(item)
+                item = os.path.dirname(item)
+
+        for path, relative_path in relative_paths.items():
+            path_tracked = relative_path in tracked or \
+                (relative_path == "." and bool(tracked))
+            self._tracked_cache[(git_repo, relative_path)] = path_tracked
+            if path_tracked:
+                result.add(path)
+
+        return result
 
     def get_git_toplevel(self, path: os.PathLike) -> Path:
         """Return the top-level Git directory of 'path'."""
@@ -312,48 +513,163 @@ class Smartmv:
         err_str = \
             f"{self.exe_name}: The file is not in a Git directory: '{path}'"
 
-        if not path.exists():
-            raise GitError(err_str)
+        try:
+            mode = os.stat(path).st_mode
+        except OSError as err:
+            raise GitError(err_str) from err
 
-        path = path.absolute()
+        path = self._absolute(path)
 
-        if path.is_file():
+        if stat.S_ISREG(mode):
             cwd = path.parent
         else:
             cwd = path
 
+        git_repo_path = self._get_dir_git_toplevel(cwd)
+        if git_repo_path is None:
+            raise GitError(err_str)
+
+        return git_repo_path
+
+    def _get_dir_git_toplevel(self, directory: Path):
+        """Return the top-level Git directory of 'directory', or None."""
+        # The top-level directory only depends on the directory, which allows
+        # the result (including failures) to be reused for other paths.
+        try:
+            return self._toplevel_cache[directory]
+        except KeyError:
+            git_repo_path = self._git_toplevel_uncached(directory)
+            self._toplevel_cache[directory] = git_repo_path
+            return git_repo_path
+
+    @staticmethod
+    def _git_toplevel_uncached(directory: os.PathLike):
+        """Return the top-level Git directory of 'directory', or None."""
+        if Smartmv._git_discovery_overridden():
+            return Smartmv._git_rev_parse_toplevel(directory)
+
+        return Smartmv._discover_git_toplevel(directory)
+
+    @staticmethod
+    def _git_discovery_overridden() -> bool:
+        """Return True if the environment changes how Git finds repositories.
+
+        In that case, only Git itself can tell where the repository is.
+        """
+        return any(var in os.environ for var in GIT_DISCOVERY_ENV_VARS)
+
+    @staticmethod
+    def _git_rev_parse_toplevel(directory: os.PathLike):
+        """Return the top-level Git directory of 'directory', or None.
+
+        The top-level directory is retrieved by executing Git.
+        """
         cmd = ["git", "rev-parse", "--show-toplevel"]
         try:
             output = subprocess.check_output(
                 cmd,
+                executable=EXECUTABLES["git"],
                 stderr=subprocess.DEVNULL,
-                cwd=cwd,
+                cwd=directory,
+                **GIT_QUERY_KWARGS,
             )
-        except subprocess.CalledProcessError as err:
-            raise GitError(err_str) from err
+        except subprocess.CalledProcessError:
+            return None
 
         try:
             git_repo_path = Path(output.splitlines()[0].decode())
-        except IndexError as err:
-            raise GitError(err_str) from err
+        except IndexError:
+            return None
 
         if not git_repo_path.exists():
-            raise GitError(err_str)
+            return None
 
         return git_repo_path
 
+    @staticmethod
+    def _discover_git_toplevel(directory: os.PathLike):
+        """Return the top-level Git directory of 'directory', or None.
+
+        The parent directories are searched for a '.git' directory or file
+        the same way Git does it, without executing Git.
+        """
+        directory = os.path.realpath(directory)
+        try:
+            device = os.stat(directory).st_dev
+        except OSError:
+            return None
+
+        while True:
+            dot_git = os.path.join(directory, ".git")
+            if os.path.isdir(dot_git):
+                if Smartmv._is_git_directory(dot_git):
+                    return Path(directory)
+            elif os.path.isfile(dot_git):
+                # Submodules and worktrees
+                git_dir = Smartmv._read_gitfile(dot_git)
+                if git_dir and Smartmv._is_git_directory(git_dir):
+                    return Path(directory)
+
+            # Bare repositories and the inside of a '.git' directory do not
+            # have a work tree.
+            if Smartmv._is_git_directory(directory):
+                return None
+
+            parent_dir = os.path.dirname(directory)
+            if parent_dir == directory:
+                return None
+
+            # Git stops at file system boundaries
+            try:
+                if os.stat(parent_dir).st_dev != device:
+                    return None
+            except OSError:
+                return None
+
+            directory = parent_dir
+
+    @staticmethod
+    def _read_gitfile(path: str):
+        """Return the Git directory referenced by the '.git' file 'path'."""
+        try:
+            with open(path, "r", encoding="utf-8") as fhandler:
+                content = fhandler.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        if not content.startswith("gitdir: "):
+            return None
+
+        git_dir = content[len("gitdir: "):].strip()
+        return os.path.join(os.path.dirname(path), git_dir)
+
+    @staticmethod
+    def _is_git_directory(path: str) -> bool:
+        """Return True if 'path' looks like a Git directory."""
+        if not os.path.isfile(os.path.join(path, "HEAD")):
+            return False
+
+        common_dir = path
+        try:
+            with open(os.path.join(path, "commondir"), "r",
+                      encoding="utf-8") as fhandler:
+                common_dir = os.path.join(path, fhandler.read().strip())
+        except (OSError, UnicodeDecodeError):
+            pass
+
+        return os.path.isdir(os.path.join(common_dir, "objects")) and \
+            os.path.isdir(os.path.join(common_dir, "refs"))
+
     @staticmethod
     def confirm(prompt: str):
         while True:
             try:
                 answer = input(prompt)
-                if answer.lower() not in ["y", "n"]:
-                    continue
-
-                if answer.lower() == "y":
+                if answer in ("y", "Y"):
                     break
 
-                return False
+                if answer in ("n", "N"):
+                    return False
             except KeyboardInterrupt:
                 print()
                 sys.exit(1)
@@ -364,4 +680,4 @@ class Smartmv:
 def command_line_interface():
     """Command line interface."""
     smartmv = Smartmv()
-    smartmv.main()
+    smartmv.main(replace_process=True)
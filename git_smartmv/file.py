@@ -20,6 +20,7 @@
 #
 """A command-line tool that can decide whether to use `git mv` or `mv`."""
 
+import atexit
 import os
 import subprocess
 from pathlib import Path
@@ -29,22 +30,160 @@ class GitError(Exception):
     """Error with Git."""
 
 
+class _CatFileWorker():
+    """A long-running 'git cat-file --batch-check' process.
+
+    A single process answers all the object lookups of a Git repository,
+    which avoids executing Git for each lookup.
+    """
+
+    # Git top-level directory -> (index signature, worker)
+    _workers = {}
+
+    def __init__(self, git_toplevel: Path):
+        # pylint: disable=consider-using-with
+        self._process = subprocess.Popen(
+            ["git", "cat-file", "--batch-check=%(objecttype)"],
+            cwd=git_toplevel,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @classmethod
+    def get(cls, git_toplevel: Path, index_signature):
+        """Return the worker of 'git_toplevel'.
+
+        Git only reads the index once, which is why the worker is replaced
+        when the index signature changes.
+        """
+        try:
+            worker_signature, worker = cls._workers[git_toplevel]
+        except KeyError:
+            pass
+        else:
+            if worker_signature == index_signature:
+                return worker
+            worker.close()
+
+        if not cls._workers:
+            atexit.register(cls.close_all)
+
+        worker = cls(git_toplevel)
+        cls._workers[git_toplevel] = (index_signature, worker)
+        return worker
+
+    @classmethod
+    def close_all(cls):
+        """Terminate all the workers."""
+        for _, worker in cls._workers.values():
+            worker.close()
+        cls._workers = {}
+
+    def object_type(self, object_name: str):
+        """Return the type of 'object_name', or None if it does not exist."""
+        self._process.stdin.write(os.fsencode(object_name) + b"\n")
+        self._process.stdin.flush()
+        line = self._process.stdout.readline()
+        if not line:
+            raise GitError("'git cat-file' exited unexpectedly")
+
+        if line.endswith(b" missing\n"):
+            return None
+
+        return line.rstrip(b"\n").decode()
+
+    def close(self):
+        """Terminate the process."""
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._process.stdout.close()
+        self._process.wait()
+
+
 class File():
     """A file or a directory."""
 
     def __init__(self, path: os.PathLike):
         self.path = Path(path)
+        self._git_toplevel = None
+        self._tracked_cache = {}
+
+    def clear_cache(self):
+        """Forget the results of the previous Git queries."""
+        self._git_toplevel = None
+        self._tracked_cache = {}
 
     def is_tracked_by_git(self):
-        """Return True if 'path' is being tracked by Git."""
+        """Return True if 'path' is being tracked by Git.
+
+        The result is cached until the Git index is modified.
+        """
         path = self.path
 
         try:
-            cmd = ["git", "-C", str(self.git_toplevel()),
-                   "ls-files", "--error-unmatch", str(path.absolute())]
+            git_toplevel = self.git_toplevel()
         except GitError:
             return False
 
+        # Without an index signature, there is no way to know whether a
+        # cached result is still valid.
+        index_signature = self._index_signature(git_toplevel)
+        if index_signature is None:
+            return self._ls_files_error_unmatch(git_toplevel)
+
+        cache_key = (str(path), index_signature)
+        try:
+            return self._tracked_cache[cache_key]
+        except KeyError:
+            pass
+
+        tracked = None
+        if not path.is_dir():
+            # The index does not contain directories
+            tracked = self._is_in_index(git_toplevel, index_signature)
+
+        if tracked is None:
+            tracked = self._ls_files_error_unmatch(git_toplevel)
+
+        self._tracked_cache[cache_key] = tracked
+        return tracked
+
+    def _is_in_index(self, git_toplevel: Path, index_signature):
+        """Return whether 'path' is in the index, or None if unknown.
+
+        The stage is always specified because Git would otherwise interpret
+        a path such as '0:foo' as the stage 0 of 'foo'. A path with a merge
+        conflict is only in the stages 1 to 3.
+        """
+        abs_path = os.path.abspath(self.path)
+        real_path = Path(os.path.realpath(os.path.dirname(abs_path)),
+                         os.path.basename(abs_path))
+        try:
+            relative_path = real_path.relative_to(git_toplevel).as_posix()
+        except ValueError:
+            return None
+
+        if "\n" in relative_path:
+            return None
+
+        try:
+            worker = _CatFileWorker.get(git_toplevel, index_signature)
+            for stage in range(4):
+                if worker.object_type(f":{stage}:{relative_path}") is not None:
+                    return True
+        except (OSError, GitError):
+            return None
+
+        return False
+
+    def _ls_files_error_unmatch(self, git_toplevel: Path) -> bool:
+        path = self.path
+        cmd = ["git", "-C", str(git_toplevel),
+               "ls-files", "--error-unmatch", str(path.absolute())]
+
         cwd = path
         if path.is_file():
             cwd = path.parent.absolute()
@@ -59,8 +198,60 @@ class File():
 
         return True
 
+    @staticmethod
+    def _index_path(git_toplevel: Path):
+        """Return the path of the Git index, or None if it is unknown."""
+        # A relative path would depend on the directory Git is executed in
+        index_file = os.environ.get("GIT_INDEX_FILE")
+        if index_file:
+            return Path(index_file) if os.path.isabs(index_file) else None
+
+        git_dir = os.environ.get("GIT_DIR")
+        if git_dir:
+            return Path(git_dir, "index") if os.path.isabs(git_dir) else None
+
+        dot_git = git_toplevel / ".git"
+        git_dir = dot_git
+        if dot_git.is_file():
+            # Submodules and worktrees
+            try:
+                content = dot_git.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                return None
+
+            if not content.startswith("gitdir: "):
+                return None
+
+            git_dir = git_toplevel / content[len("gitdir: "):].strip()
+
+        return git_dir / "index"
+
+    @staticmethod
+    def _index_signature(git_toplevel: Path):
+        """Return a value that changes each time the Git index is written.
+
+        None is returned when the index cannot be found.
+        """
+        index_path = File._index_path(git_toplevel)
+        if index_path is None:
+            return None
+
+        try:
+            index_stat = os.stat(index_path)
+        except OSError:
+            return None
+
+        # Git replaces the index with a new file each time it is written
+        return (index_stat.st_ino, index_stat.st_mtime_ns, index_stat.st_size)
+
     def git_toplevel(self) -> Path:
         """Return the top-level Git directory of 'path'."""
+        if self._git_toplevel is None:
+            self._git_toplevel = self._find_git_toplevel()
+
+        return self._git_toplevel
+
+    def _find_git_toplevel(self) -> Path:
         path = self.path
         err_str = f"The file is not in a Git directory: '{path}'"
 
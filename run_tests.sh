@@ -1,2 +1,2 @@
 #!/usr/bin/env bash
-PYTHONPATH=. pytest tests/file.py
+PYTHONPATH=. pytest tests/file.py tests/smartmv.py
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+# The objects written by the tests do not need to survive a crash
+_GIT_ENV = {**os.environ, "GIT_OPTIONAL_LOCKS": "0",
+            "GIT_TERMINAL_PROMPT": "0",
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "core.fsync",
+            "GIT_CONFIG_VALUE_0": "none"}
+_GIT_PATH = shutil.which("git")
+
+# 'git init' creates many small files, which is faster on a tmpfs
+_TMP_ROOT = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+
+
+def _check_call_git(args):
+    # Without 'cwd' and 'close_fds', and with the absolute path of Git,
+    # subprocess uses os.posix_spawn() instead of fork() and exec().
+    subprocess.check_call(["git"] + args, executable=_GIT_PATH,
+                          env=_GIT_ENV, close_fds=False,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope="session")
+def check_call_git():
+    """Execute Git quietly, with the arguments passed as a list."""
+    return _check_call_git
+
+
+@pytest.fixture(scope="module")
+def git_repo():
+    """An initialized Git repository shared by the tests of a module."""
+    with TemporaryDirectory("test_smartmv", dir=_TMP_ROOT) as tmpdir:
+        git_dir = Path(tmpdir).joinpath("repo")
+        os.makedirs(git_dir)
+        _check_call_git(["-C", str(git_dir), "init", "-q"])
+        yield git_dir
+
+
+@pytest.fixture
+def new_git_repo(tmp_path):
+    """An initialized Git repository that belongs to a single test."""
+    git_dir = tmp_path.joinpath("repo")
+    os.makedirs(git_dir)
+    _check_call_git(["-C", str(git_dir), "init", "-q"])
+    return git_dir
@@ -1,31 +1,106 @@
 #!/usr/bin/env python
 
 import os
-import shutil
 import subprocess
+import uuid
 from pathlib import Path
-from tempfile import TemporaryDirectory
+
+import pytest
 
 from git_smartmv.file import File
 
 
-def test_file():
-    with TemporaryDirectory("test_smartmv") as tmpdir:
-        git_dir = Path(tmpdir).joinpath("repo")
-        os.makedirs(git_dir)
-        try:
-            file_path = git_dir.joinpath("file")
-            with open(file_path, "w",
-                      encoding="utf-8") as fhandler:
-                fhandler.write("Hello world")
-            subprocess.check_call(["git", "init"], cwd=git_dir)
-
-            file_class = File(str(file_path))
-            assert file_class.path.resolve() == file_path.resolve()
-            assert file_class.git_toplevel().resolve() == git_dir.resolve()
-
-            assert file_class.is_tracked_by_git() == False
-            subprocess.check_call(["git", "add", "file"], cwd=git_dir)
-            assert file_class.is_tracked_by_git() == True
-        finally:
-            shutil.rmtree(git_dir)
+def test_file(git_repo, check_call_git):
+    file_name = f"file_{uuid.uuid4().hex}"
+    file_path = os.path.join(git_repo, file_name)
+    with open(file_path, "wb") as fhandler:
+        fhandler.write(b"Hello world")
+
+    resolved_file_path = Path(os.path.realpath(file_path))
+    resolved_git_repo = resolved_file_path.parent
+
+    file_class = File(file_path)
+    assert file_class.path.resolve() == resolved_file_path
+    assert file_class.git_toplevel().resolve() == resolved_git_repo
+
+    assert file_class.is_tracked_by_git() == False
+    check_call_git(["-C", str(git_repo), "add", file_name])
+    assert file_class.is_tracked_by_git() == True
+
+
+def test_file_with_merge_conflict(new_git_repo, check_call_git):
+    def git(*args):
+        check_call_git(["-C", str(new_git_repo), "-c", "user.name=test",
+                        "-c", "user.email=test@localhost"] + list(args))
+
+    file_path = new_git_repo.joinpath("file")
+    file_path.write_bytes(b"base")
+    git("add", "file")
+    git("commit", "-q", "-m", "Base")
+    git("checkout", "-q", "-b", "other")
+    file_path.write_bytes(b"other")
+    git("commit", "-q", "-a", "-m", "Other")
+    git("checkout", "-q", "-")
+    file_path.write_bytes(b"main")
+    git("commit", "-q", "-a", "-m", "Main")
+    with pytest.raises(subprocess.CalledProcessError):
+        git("merge", "other")
+
+    # The index only contains the stages 1 to 3 of the conflicted file
+    assert File(file_path).is_tracked_by_git() == True
+
+
+def test_file_with_stage_prefix(new_git_repo, monkeypatch, check_call_git):
+    new_git_repo.joinpath("foo").write_bytes(b"Hello world")
+    check_call_git(["-C", str(new_git_repo), "add", "foo"])
+
+    # Git would interpret ':0:foo' as the stage 0 of 'foo'
+    file_path = new_git_repo.joinpath("0:foo")
+    file_path.write_bytes(b"Hello world")
+
+    # The index is enough to answer, tracked or not
+    def ls_files_error_unmatch(*_):
+        raise AssertionError("'git ls-files' should not be executed")
+
+    monkeypatch.setattr(File, "_ls_files_error_unmatch",
+                        ls_files_error_unmatch)
+    assert File(file_path).is_tracked_by_git() == False
+    assert File(new_git_repo.joinpath("foo")).is_tracked_by_git() == True
+
+
+def test_file_with_git_dir_env(tmp_path, monkeypatch, check_call_git):
+    git_dir = tmp_path.joinpath("git_dir")
+    work_tree = tmp_path.joinpath("work_tree")
+    os.makedirs(work_tree)
+    git_args = ["--git-dir", str(git_dir), "--work-tree", str(work_tree)]
+    check_call_git(git_args + ["init", "-q"])
+
+    file_path = work_tree.joinpath("file")
+    file_path.write_bytes(b"Hello world")
+
+    monkeypatch.setenv("GIT_DIR", str(git_dir))
+    monkeypatch.setenv("GIT_WORK_TREE", str(work_tree))
+    file_class = File(file_path)
+    assert file_class.is_tracked_by_git() == False
+    check_call_git(git_args + ["add", "file"])
+    assert file_class.is_tracked_by_git() == True
+
+
+def test_file_clear_cache(new_git_repo, check_call_git):
+    sub_dir = new_git_repo.joinpath("sub")
+    os.makedirs(sub_dir)
+    file_path = sub_dir.joinpath("file")
+    file_path.write_bytes(b"Hello world")
+    check_call_git(["-C", str(new_git_repo), "add", "sub/file"])
+
+    file_class = File(file_path)
+    assert file_class.git_toplevel().resolve() == new_git_repo.resolve()
+    assert file_class.is_tracked_by_git() == True
+
+    # The file now belongs to a nested repository, which the cached results
+    # do not know about until the cache is cleared.
+    check_call_git(["-C", str(sub_dir), "init", "-q"])
+    assert file_class.git_toplevel().resolve() == new_git_repo.resolve()
+    file_class.clear_cache()
+    assert file_class.git_toplevel().resolve() == sub_dir.resolve()
+    assert file_class.is_tracked_by_git() == False
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+import os
+import signal
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from git_smartmv import Smartmv
+
+
+def test_git_mv_single_command(new_git_repo, check_call_git):
+    dest_dir = new_git_repo.joinpath("dest")
+    os.makedirs(dest_dir)
+
+    source_paths = []
+    for index in range(5):
+        file_path = new_git_repo.joinpath(f"file{index}")
+        file_path.write_bytes(b"Hello world")
+        source_paths.append(str(file_path))
+    check_call_git(["-C", str(new_git_repo), "add", "."])
+
+    smartmv = Smartmv()
+    smartmv.main(["--non-interactive"] + source_paths + [str(dest_dir)])
+
+    # pylint: disable=protected-access
+    assert list(smartmv._mv_commands) == ["git mv"]
+    git_mv_cmd = smartmv._mv_commands["git mv"]
+    assert git_mv_cmd[-1] == str(dest_dir)
+    assert git_mv_cmd[-6:-1] == source_paths
+
+    for index in range(5):
+        assert dest_dir.joinpath(f"file{index}").is_file()
+
+
+def test_git_mv_rename(new_git_repo, check_call_git):
+    file_path = new_git_repo.joinpath("file")
+    file_path.write_bytes(b"Hello world")
+    check_call_git(["-C", str(new_git_repo), "add", "file"])
+
+    renamed_file_path = new_git_repo.joinpath("renamed_file")
+    smartmv = Smartmv()
+    smartmv.main(["--non-interactive", str(file_path),
+                  str(renamed_file_path)])
+
+    # pylint: disable=protected-access
+    assert list(smartmv._mv_commands) == ["git mv"]
+    assert smartmv._mv_commands["git mv"][-2:] == \
+        [str(file_path), str(renamed_file_path)]
+    assert renamed_file_path.is_file()
+    assert not file_path.exists()
+
+
+def test_replace_process_restores_signals(new_git_repo, monkeypatch):
+    file_path = new_git_repo.joinpath("file")
+    file_path.write_bytes(b"Hello world")
+
+    execv_calls = []
+
+    def fake_execv(path, args):
+        execv_calls.append((path, args, signal.getsignal(signal.SIGPIPE)))
+        raise SystemExit(0)
+
+    monkeypatch.setattr(os, "execv", fake_execv)
+    sigpipe_handler = signal.getsignal(signal.SIGPIPE)
+    try:
+        with pytest.raises(SystemExit):
+            Smartmv().main(["--non-interactive", str(file_path),
+                            str(new_git_repo.joinpath("renamed_file"))],
+                           replace_process=True)
+    finally:
+        signal.signal(signal.SIGPIPE, sigpipe_handler)
+
+    assert len(execv_calls) == 1
+    assert execv_calls[0][1][0] == "mv"
+    assert execv_calls[0][2] == signal.SIG_DFL
+
+
+def test_git_mv_pathspec_magic_names(new_git_repo, check_call_git):
+    dest_dir = new_git_repo.joinpath("dest")
+    os.makedirs(dest_dir)
+
+    # Names that Git would interpret as pathspec magic or glob patterns
+    source_paths = []
+    for file_name in (":x", "g[1]"):
+        file_path = new_git_repo.joinpath(file_name)
+        file_path.write_bytes(b"Hello world")
+        check_call_git(["--literal-pathspecs", "-C", str(new_git_repo),
+                        "add", "--", file_name])
+        source_paths.append(str(file_path))
+
+    smartmv = Smartmv()
+    smartmv.main(["--non-interactive"] + source_paths + [str(dest_dir)])
+
+    # pylint: disable=protected-access
+    assert list(smartmv._mv_commands) == ["git mv"]
+    assert smartmv._mv_commands["git mv"][-3:-1] == source_paths
+
+
+def test_get_tracked_paths(new_git_repo, check_call_git):
+    for dir_name in ("tracked_dir", "untracked_dir"):
+        os.makedirs(new_git_repo.joinpath(dir_name, "sub"))
+        new_git_repo.joinpath(dir_name, "sub", "file").write_bytes(b"")
+    new_git_repo.joinpath("g1").write_bytes(b"")
+    new_git_repo.joinpath("g[1]").write_bytes(b"")
+    check_call_git(["-C", str(new_git_repo), "add", "tracked_dir", "g1"])
+
+    paths = [new_git_repo.joinpath(name)
+             for name in ("tracked_dir", "tracked_dir/sub",
+                          "tracked_dir/sub/file", "untracked_dir",
+                          "untracked_dir/sub/file", "g1", "g[1]")]
+
+    smartmv = Smartmv()
+    assert smartmv.get_tracked_paths(new_git_repo, paths) == \
+        set(paths[0:3] + [paths[5]])
+
+    # The top-level directory is tracked as soon as it contains a tracked file
+    assert smartmv.get_tracked_paths(new_git_repo, [new_git_repo]) == \
+        {new_git_repo}
+
+
+def _rev_parse_toplevel(directory):
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--show-toplevel"],
+            cwd=directory,
+            stderr=subprocess.DEVNULL,
+        )
+    except subprocess.CalledProcessError:
+        return None
+
+    return Path(output.decode().rstrip("\n"))
+
+
+def test_discover_git_toplevel(tmp_path, new_git_repo, check_call_git):
+    os.makedirs(new_git_repo.joinpath("dir", "sub"))
+    check_call_git(["-C", str(new_git_repo), "-c", "user.name=test",
+                    "-c", "user.email=test@localhost",
+                    "commit", "-q", "--allow-empty", "-m", "Initial commit"])
+    check_call_git(["-C", str(new_git_repo), "worktree", "add", "-q",
+                    str(tmp_path.joinpath("worktree"))])
+    check_call_git(["init", "-q", "--separate-git-dir",
+                    str(tmp_path.joinpath("separate.git")),
+                    str(tmp_path.joinpath("separate"))])
+    check_call_git(["init", "-q", "--bare", str(tmp_path.joinpath("bare"))])
+    os.makedirs(tmp_path.joinpath("not_a_repo"))
+
+    directories = [
+        new_git_repo,
+        new_git_repo.joinpath("dir", "sub"),
+        new_git_repo.joinpath(".git"),
+        new_git_repo.joinpath(".git", "objects"),
+        tmp_path.joinpath("worktree"),
+        tmp_path.joinpath("separate"),
+        tmp_path.joinpath("bare"),
+        tmp_path.joinpath("bare", "refs"),
+        tmp_path.joinpath("not_a_repo"),
+    ]
+    for directory in directories:
+        # pylint: disable=protected-access
+        assert Smartmv._discover_git_toplevel(directory) == \
+            _rev_parse_toplevel(directory), directory
+
+    assert _rev_parse_toplevel(new_git_repo.joinpath("dir")) == \
+        new_git_repo.resolve()
+    assert _rev_parse_toplevel(tmp_path.joinpath("bare")) is None
+
+
+def test_warning_threshold(tmp_path, monkeypatch, capsys):
+    source_dir = tmp_path.joinpath("src")
+    os.makedirs(source_dir.joinpath("sub"))
+    os.makedirs(tmp_path.joinpath("other"))
+    os.makedirs(tmp_path.joinpath("dest"))
+    for path in ("src/a", "src/.hidden", "src/sub/b", "other/c", "f"):
+        tmp_path.joinpath(path).write_bytes(b"")
+    # Symbolic links to directories are neither followed nor counted
+    os.symlink("../other", source_dir.joinpath("link_dir"))
+    os.symlink("a", source_dir.joinpath("link_file"))
+
+    prompts = []
+
+    def fake_input(prompt):
+        prompts.append(prompt)
+        return "n"
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("builtins.input", fake_input)
+    with pytest.raises(SystemExit):
+        Smartmv().main(["--non-interactive", "--warning-threshold", "3",
+                        "src", "f", "dest"])
+
+    assert sorted(capsys.readouterr().out.splitlines()) == \
+        ["f", "src/.hidden", "src/a", "src/link_file", "src/sub/b"]
+    assert prompts == ["Move 5 files to 'dest'? [y,n] "]
+
+    monkeypatch.chdir(source_dir)
+    assert sorted(Smartmv.walk_files(".")) == \
+        [".hidden", "a", "link_file", "sub/b"]